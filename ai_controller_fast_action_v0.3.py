@@ -5,17 +5,21 @@ ai_controller.py
 A Python AI controller for Unity that:
   1. Listens for JSON "GET" requests from Unity every tick.
   2. Receives state updates as JSON (function handle_state).
-  3. Maintains the latest state in a shared object protected by a lock.
-  4. Requests a screen dump from Unity and receives it as a PIL Image.
-  5. Analyzes the image and decides on actions.
+  3. Maintains the latest state in a GameState object per connection.
+  4. Requests a screen dump from Unity and decodes it with OpenCV into a NumPy BGR array.
+  5. Analyzes the image as a NumPy array (Numba-compiled when available) and decides on actions.
   6. Sends commands back to Unity.
   7. Handles game states for game restart and end conditions.
   8. Handles clean shutdown on Ctrl+C or game end.
+  9. Serves every Unity client from a single asyncio event loop, decoding and analyzing frames in worker threads.
 
 Updates need by the user:
 - Python code:
   User should implement the ai_image_analyzer function to analyze the image and together with the 
   last received state (see function handle_state) it should decide on the next command.
+  Work on the NumPy frame, never pixel by pixel in plain Python:
+    - whole-frame features (color masks, counts, histograms) with NumPy reductions, see _features
+    - per-pixel loops in _analyze, which is compiled with Numba (pip install numba) so they run at native speed
   The decision can be made either when the images is received and has been analyzed or periodically in the send_loop function.
 
 - Unity configuration:
@@ -40,50 +44,102 @@ Updates need by the user:
 Usage:
     python ai_controller.py <port>
 """
+import asyncio
 import socket
+import struct
 import sys
+import functools
 import json
+import queue
 import random
 import signal
 import threading
-import time
+import traceback
 from typing import Dict, Any
 import base64
-from typing import Optional, List
-from PIL import Image
-import io
+from typing import Optional, List, Tuple
+import cv2
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional, without it _analyze runs as plain (slow) Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+try:
+    import orjson
+    _loads = orjson.loads  # raises orjson.JSONDecodeError, a subclass of json.JSONDecodeError
+except ImportError:  # orjson is optional, fall back to the standard library parser
+    _loads = json.loads
+
+
+# Global shutdown flag, plus the event loop and event used to wake it up on shutdown
+shutdown = False
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_shutdown_event: Optional[asyncio.Event] = None
 
+# Print every received state; slows down the receive loop on fast update rates
+LOG_STATE = False
+_STATE_FMT = "isDead: %s, numActivePlayers: %s, hasWeapon: %s, numWeapons: %s, gameEnded: %s\n"
+
+# Frames are shrunk to this (width, height) with cv2.resize before ai_image_analyzer sees them.
+# 160x90 is 16x fewer pixels than a 640x360 frame (screenResolutionScale 0.5) at the cost of detail;
+# set to None to analyze the full-resolution frame.
+ANALYSIS_SIZE: Optional[Tuple[int, int]] = (160, 90)
+
+# Don't resend a movement-only command (LEFT/RIGHT) identical to the previous command sent on the
+# connection, e.g. repeated "RIGHT:1.00" while moving steadily. One-shot actions (JUMP, SHOOT,
+# PICKUP, DROP) are always sent. Set to False to send every command.
+SKIP_DUPLICATE_COMMANDS = True
+_MOVEMENT_PREFIXES = (b"LEFT:", b"RIGHT:")
+
+# 4-byte big-endian size that Unity sends before each image
+IMAGE_SIZE_PREFIX = struct.Struct(">I")
+
+# Debug: save every Nth received frame to DEBUG_SAVE_PATH (0 disables saving)
+DEBUG_SAVE_EVERY_N = 0
+DEBUG_SAVE_PATH = "latest_frame.png"
+
+# Frames waiting to be written by the save worker; full means frames are dropped
+save_queue: "queue.Queue[Tuple[str, np.ndarray]]" = queue.Queue(maxsize=2)
+
+
+def save_worker():
+    """Write queued debug frames to disk so the event loop never blocks on disk I/O."""
+    while True:
+        path, img = save_queue.get()
+        try:
+            cv2.imwrite(path, img)
+        except Exception as e:
+            print("Failed to save frame:", e)
 
-# Global shutdown flag and server socket
-shutdown = False
-server_sock: socket.socket
-next_command = None
 
-def request_image(conn: socket.socket) -> Optional[Image.Image]:
+async def request_image(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[bytes]:
     """
-    Ask Unity for a screen dump and read it back as a PIL Image.
+    Ask Unity for a screen dump and return the encoded image (see process_frame for decoding).
     Unity must reply with a 4-byte big-endian size, then the raw JPEG/PNG bytes.
     """
     try:
-        conn.sendall(b"GET_IMAGE\n")
+        writer.write(b"GET_IMAGE\n")
+        await writer.drain()
 
         # Read size prefix
-        length_bytes = conn.recv(4)
-        if len(length_bytes) < 4:
+        try:
+            length_bytes = await reader.readexactly(IMAGE_SIZE_PREFIX.size)
+        except asyncio.IncompleteReadError:
             print("Image request: incomplete length prefix")
             return None
-        img_size = int.from_bytes(length_bytes, byteorder="big")
+        (img_size,) = IMAGE_SIZE_PREFIX.unpack(length_bytes)
 
         # Read the image itself
-        data = b""
-        while len(data) < img_size:
-            packet = conn.recv(img_size - len(data))
-            if not packet:
-                print("Image request: connection closed mid-image")
-                return None
-            data += packet
-
-        return Image.open(io.BytesIO(data))
+        try:
+            return await reader.readexactly(img_size)
+        except asyncio.IncompleteReadError:
+            print("Image request: connection closed mid-image")
+            return None
     except Exception as e:
         print("Failed to fetch image:", e)
         return None
@@ -91,16 +147,11 @@ def request_image(conn: socket.socket) -> Optional[Image.Image]:
 
 def signal_handler(sig, frame):
     """Signal handler for a clean shutdown on Ctrl+C"""
-    global shutdown, server_sock
+    global shutdown
     print("\nShutting down AI server...")
     shutdown = True
-    try:
-        server_sock.close()
-    except Exception:
-        pass
-
-
-signal.signal(signal.SIGINT, signal_handler)
+    if _loop is not None and _shutdown_event is not None:
+        _loop.call_soon_threadsafe(_shutdown_event.set)
 
 
 # ---------------------------------------------------------------------------
@@ -120,65 +171,68 @@ class AICommandBuilder:
     """
 
     def __init__(self):
-        self._commands = []  # type: List[str]
+        self._parts: List[bytes] = []
 
     def left(self, amount: float) -> "AICommandBuilder":
         assert 0.0 <= amount <= 1.0, "LEFT amount must be between 0.0 and 1.0"
-        self._commands.append(f"LEFT:{amount:.2f}")
+        self._parts.append(_amount_cmd(b"LEFT", round(amount * 100)))
         return self
 
     def right(self, amount: float) -> "AICommandBuilder":
         assert 0.0 <= amount <= 1.0, "RIGHT amount must be between 0.0 and 1.0"
-        self._commands.append(f"RIGHT:{amount:.2f}")
+        self._parts.append(_amount_cmd(b"RIGHT", round(amount * 100)))
         return self
 
     def jump(self, amount: float) -> "AICommandBuilder":
         assert 0.0 <= amount <= 1.0, "JUMP amount must be between 0.0 and 1.0"
-        self._commands.append(f"JUMP:{amount:.2f}")
+        self._parts.append(_amount_cmd(b"JUMP", round(amount * 100)))
         return self
 
     def pickup(self) -> "AICommandBuilder":
-        self._commands.append("PICKUP")
+        self._parts.append(b"PICKUP")
         return self
 
     def drop(self) -> "AICommandBuilder":
-        self._commands.append("DROP")
+        self._parts.append(b"DROP")
         return self
 
     def shoot(self) -> "AICommandBuilder":
-        self._commands.append("SHOOT")
+        self._parts.append(b"SHOOT")
         return self
 
     def clear(self) -> "AICommandBuilder":
         """Clear any previously added commands."""
-        self._commands.clear()
+        self._parts.clear()
         return self
 
-    def build(self) -> str:
-        """Serialize all added commands into a single semicolon-delimited string."""
-        return ";".join(self._commands)
+    def build(self) -> bytes:
+        """Serialize all added commands into a single semicolon-delimited, newline-terminated line ready to send."""
+        return b";".join(self._parts) + b"\n"
+
 
+@functools.lru_cache(maxsize=None)
+def _amount_cmd(name: bytes, hundredths: int) -> bytes:
+    """Encode a command with an amount, e.g. b"LEFT:0.50". Amounts are quantized to 0.01, so at most 101 per command."""
+    return b"%s:%.2f" % (name, hundredths / 100)
 
-def random_choose_cmd() -> str:
+
+# Every command random_choose_cmd can return, built once
+_RANDOM_CMDS = (
+    AICommandBuilder().left(1.0).build(),
+    AICommandBuilder().right(1.0).build(),
+    AICommandBuilder().jump(1.0).build(),
+    AICommandBuilder().pickup().build(),
+    AICommandBuilder().drop().build(),
+    AICommandBuilder().shoot().build(),
+)
+
+
+def random_choose_cmd() -> bytes:
     """Randomly choose a command to send to Unity."""
-    builder = AICommandBuilder().clear()
-    cmd_type = random.choice([0, 1, 2, 3, 4, 5])
-    if cmd_type == 0:
-        builder.left(1.0)
-    elif cmd_type == 1:
-        builder.right(1.0)
-    elif cmd_type == 2:
-        builder.jump(1.0)
-    elif cmd_type == 3:
-        builder.pickup()
-    elif cmd_type == 4:
-        builder.drop()
-    else:
-        builder.shoot()
-    return builder.build() + "\n"
+    return random.choice(_RANDOM_CMDS)
 
 
-def test_random_choose_cmd() -> str:
+def test_random_choose_cmd() -> bytes:
     """Randomly choose a command to send to Unity."""
     builder = AICommandBuilder().clear()
     cmd_type = random.choice([0, 1])
@@ -187,172 +241,293 @@ def test_random_choose_cmd() -> str:
 
     # if cmd_type == 1:
     builder.jump(1.0)
-    return builder.build() + "\n"
-
-
-def handle_state(state_str, state_lock, shared_state) -> bool:
-    has_game_ended = False
-
-    state_json: Dict[str, Any] = json.loads(state_str)
-    with state_lock:
-        shared_state["isDead"] = state_json.get("isDead", False)
-        shared_state["numActivePlayers"] = state_json.get("numActivePlayers", 0)
-        shared_state["hasWeapon"] = state_json.get("hasWeapon", False)
-        shared_state["numWeapons"] = state_json.get("numWeapons", 0)
-        shared_state["gameEnded"] = state_json.get("gameEnded", False)
-
-    print(
-        f"isDead: {shared_state['isDead']}, "
-        f"numActivePlayers: {shared_state['numActivePlayers']}, "
-        f"hasWeapon: {shared_state['hasWeapon']}, "
-        f"numWeapons: {shared_state['numWeapons']}, "
-        f"gameEnded: {shared_state['gameEnded']}"
-    )
+    return builder.build()
 
-    # Check for end conditions
-    if state_json.get("gameEnded", False) or shared_state["isDead"]:
-        has_game_ended = True
 
-    return has_game_ended
+class GameState:
+    """
+    Latest state received from Unity for one AI player.
+    Fields are plain scalars rebound as a whole, so they can be read without a lock.
+    """
+    __slots__ = ("isDead", "numActivePlayers", "hasWeapon", "numWeapons", "gameEnded")
+
+    def __init__(self):
+        self.isDead = False  # type: bool
+        self.numActivePlayers = 0  # type: int
+        self.hasWeapon = False  # type: bool
+        self.numWeapons = 0  # type: int
+        self.gameEnded = False  # type: bool
+
+
+def handle_state(state_str, state: GameState) -> bool:
+    state_json: Dict[str, Any] = _loads(state_str)
+    is_dead = state_json.get("isDead", False)
+    num_active_players = state_json.get("numActivePlayers", 0)
+    has_weapon = state_json.get("hasWeapon", False)
+    num_weapons = state_json.get("numWeapons", 0)
+    game_ended = state_json.get("gameEnded", False)
+
+    state.isDead = is_dead
+    state.numActivePlayers = num_active_players
+    state.hasWeapon = has_weapon
+    state.numWeapons = num_weapons
+    state.gameEnded = game_ended
+
+    if LOG_STATE:
+        sys.stdout.write(_STATE_FMT % (is_dead, num_active_players, has_weapon, num_weapons, game_ended))
 
-def ai_image_analyzer(image: Image.Image) -> str:
+    # Check for end conditions
+    return bool(game_ended or is_dead)
+
+def _features(arr: np.ndarray, step: int = 1) -> Dict[str, Any]:
+    """
+    Example image features computed with vectorized NumPy reductions.
+    Only every step-th row and column of the HxWx3 uint8 BGR frame is used; frames are already
+    downsampled to ANALYSIS_SIZE, so use step > 1 only when analyzing full-resolution frames.
+    Positions are returned in pixels of arr.
+    """
+    small = arr[::step, ::step]
+    blue, green, red = small[..., 0], small[..., 1], small[..., 2]
+
+    # Strongly red pixels, e.g. to find another player or a projectile
+    red_mask = (red > 180) & (green < 80) & (blue < 80)
+    red_count = int(np.count_nonzero(red_mask))
+    red_center = np.argwhere(red_mask).mean(axis=0) * step if red_count else None
+    red_column = int(np.argmax(red_mask.sum(axis=0))) * step if red_count else None
+
+    return {
+        "mean_bgr": small.reshape(-1, 3).mean(axis=0),
+        "red_count": red_count,
+        "red_center": red_center,  # (row, col) or None
+        "red_column": red_column,  # column with the most red pixels, or None
+    }
+
+
+# Command ids returned by _analyze, translated into commands by ai_image_analyzer
+CMD_NONE = -1
+CMD_RANDOM = -2  # placeholder: ai_image_analyzer sends random_choose_cmd()
+CMD_LEFT = 0
+CMD_RIGHT = 1
+CMD_JUMP = 2
+CMD_PICKUP = 3
+CMD_DROP = 4
+CMD_SHOOT = 5
+
+
+# The explicit signature compiles _analyze when the module is imported, and cache=True
+# loads that compiled code from disk on later runs, so no frame pays for the JIT.
+@njit("Tuple((int64, float64))(uint8[:, :, ::1])", cache=True, fastmath=True, nogil=True)
+def _analyze(arr):
     """
-    Analyze the image and return a command based on the analysis.
-    This is a placeholder function and should be replaced with actual analysis logic.
+    Per-pixel analysis of a C-contiguous HxWx3 uint8 BGR frame, compiled with Numba.
+    Returns a (command id, amount) tuple. This is a placeholder and should be replaced with actual analysis logic.
     """
-    # example how to use the API to build commands
-    # builder = AICommandBuilder().clear()
-    #     builder.shoot()
-    #     builder.left(1.0)
-    #     builder.right(0.5)
-    #     builder.jump(0.5)
-    #     builder.pickup()
-    #     builder.drop()
-    # cmd_str = builder.build() + "\n"
-    # try:
-    #     conn.sendall(cmd_str.encode("ascii"))
-    
+    height, width = arr.shape[0], arr.shape[1]
+    lit = 0
+    for y in range(height):
+        for x in range(width):
+            if arr[y, x, 0] > 0 or arr[y, x, 1] > 0 or arr[y, x, 2] > 0:
+                lit += 1
+
+    # A completely black frame (e.g. while a level loads) gives nothing to act on
+    if lit == 0:
+        return CMD_NONE, 0.0
+
     # Example: Just return a random command for now
-    return random_choose_cmd()
+    return CMD_RANDOM, 0.0
+
 
-def handle_client(conn: socket.socket, addr, port: int):
+def ai_image_analyzer(arr: np.ndarray) -> Optional[bytes]:
+    """
+    Analyze the image (HxWx3 uint8 BGR array) and return a command based on the analysis,
+    or None if no command should be sent.
+    Use _features for NumPy-based features and _analyze for per-pixel loops.
+    """
+    cmd_id, amount = _analyze(np.ascontiguousarray(arr))
+
+    builder = AICommandBuilder()
+    if cmd_id == CMD_LEFT:
+        builder.left(amount)
+    elif cmd_id == CMD_RIGHT:
+        builder.right(amount)
+    elif cmd_id == CMD_JUMP:
+        builder.jump(amount)
+    elif cmd_id == CMD_PICKUP:
+        builder.pickup()
+    elif cmd_id == CMD_DROP:
+        builder.drop()
+    elif cmd_id == CMD_SHOOT:
+        builder.shoot()
+    elif cmd_id == CMD_RANDOM:
+        return random_choose_cmd()
+    else:
+        return None
+    return builder.build()
+
+
+def _is_movement_only(cmd: bytes) -> bool:
+    """True if every command in the line is a LEFT/RIGHT movement."""
+    return all(part.startswith(_MOVEMENT_PREFIXES) for part in cmd.rstrip(b"\n").split(b";"))
+
+
+def process_frame(data: bytes) -> Tuple[Optional[np.ndarray], Optional[bytes]]:
+    """
+    Decode an encoded frame, shrink it to ANALYSIS_SIZE and run ai_image_analyzer on it.
+    Returns (full-resolution BGR frame, command), with None for a frame that could not be decoded
+    or when no command should be sent.
+    Called in a worker thread, so a slow analyzer does not stall the other connections.
+    """
+    # np.frombuffer does not copy the received bytes
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        print("Failed to decode image")
+        return None, None
+
+    # INTER_AREA averages pixel blocks, which keeps small objects visible when shrinking
+    small = cv2.resize(img, ANALYSIS_SIZE, interpolation=cv2.INTER_AREA) if ANALYSIS_SIZE else img
+    return img, ai_image_analyzer(small)
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, port: int):
     """Handle all communication with a single Unity client"""
+    addr = writer.get_extra_info("peername")
     print(f"[Port {port}] Connected by {addr}")
-    conn.settimeout(1.0)
 
-    # Shared state and lock
-    shared_state: Dict[str, Any] = {"isDead": False, "numActivePlayers": 0}
-    state_lock = threading.Lock()
+    # Latest state received from Unity
+    state = GameState()
 
-    # Events for coordination
-    stop_event = threading.Event()
+    # Commands produced by recv_loop, sent by send_loop
+    cmd_queue: "asyncio.Queue[bytes]" = asyncio.Queue()
 
-    def should_fetch_image(state: Dict[str, Any]) -> bool:
+    def should_fetch_image(state: GameState) -> bool:
         # always fetch, or only when numActivePlayers changes, etc.
         return True
 
-    def recv_loop():
-        global next_command
-        buffer = ""
+    async def recv_loop():
+        loop = asyncio.get_running_loop()
+        frame_count = 0
         try:
-            while not stop_event.is_set() and not shutdown:
+            while not shutdown:
                 try:
-                    chunk = conn.recv(4096)
-                except socket.timeout:
-                    continue
+                    raw_line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError:
+                    print(f"[Port {port}] Connection closed by Unity.")
+                    break
 
-                if not chunk:
+                line = raw_line.decode("ascii", errors="ignore").strip()
+                if not line:
                     continue
 
-                buffer += chunk.decode("ascii", errors="ignore")
-                while "\n" in buffer:
-                    line, buffer = buffer.split("\n", 1)
-                    line = line.strip()
-                    if not line:
-                        continue
-
-                    try:
-                        has_game_ended = handle_state(line, state_lock, shared_state)
-                    except json.JSONDecodeError as e:
-                        print("JSON parse error:", e, line)
-                        continue
-
-                    if has_game_ended:
-                        print(f"[Port {port}] Game ended or player is dead.")
-                        stop_event.set()
-                        break
-                    else:
-                        if should_fetch_image(shared_state):
-                            img = request_image(conn)
-                            if img:
-                                next_command = ai_image_analyzer(img)
-                                img.save("latest_frame.png")
-                                print("Saved latest_frame.png")
-        finally:
-            stop_event.set()
-
-    def send_loop():
-        """Send a command each second, based on the latest state."""
-        global next_command
-        while not stop_event.is_set() and not shutdown:
-            # Snapshot the latest state
-            with state_lock:
-                latest = dict(shared_state)
-
-            # next command is calculated when receiving the image
-            # The user can also choose to send the command when the image is received in function ai_image_analyzer
-            if next_command:
                 try:
-                    conn.sendall(next_command.encode("ascii"))     
-                    next_command = None          
-                except Exception as e:
-                    print(f"[Port {port}] Send failed: {e}")
-                    stop_event.set()
-                    break
+                    has_game_ended = handle_state(line, state)
+                except json.JSONDecodeError as e:
+                    print("JSON parse error:", e, line)
+                    continue
 
-            # User can edit here:
-            # Update this to send commands faster, by default periodically every 0.5 sec.
-            # Sleep ~0.5s in short increments to detect stop_event promptly
-            for _ in range(10):
-                if stop_event.is_set() or shutdown:
+                if has_game_ended:
+                    print(f"[Port {port}] Game ended or player is dead.")
                     break
-                time.sleep(0.5)
 
-    # Start receiver and sender threads
-    receiver = threading.Thread(target=recv_loop, daemon=True)
-    sender = threading.Thread(target=send_loop, daemon=True)
-    receiver.start()
-    sender.start()
-
-    # Wait for game end or shutdown
-    receiver.join()
-    stop_event.set()
-    sender.join()
+                if should_fetch_image(state):
+                    data = await request_image(reader, writer)
+                    if data is None:
+                        continue
 
-    conn.close()
+                    # cv2 and the Numba analyzer release the GIL, so this runs in parallel with other clients
+                    img, cmd = await loop.run_in_executor(None, process_frame, data)
+                    if cmd:
+                        cmd_queue.put_nowait(cmd)
+
+                    if img is not None:
+                        frame_count += 1
+                        if DEBUG_SAVE_EVERY_N and frame_count % DEBUG_SAVE_EVERY_N == 0:
+                            try:
+                                save_queue.put_nowait((DEBUG_SAVE_PATH, img))
+                                print(f"[Port {port}] Saving frame {frame_count} to {DEBUG_SAVE_PATH}")
+                            except queue.Full:
+                                pass
+        except (OSError, asyncio.LimitOverrunError) as e:
+            print(f"[Port {port}] Receive failed: {e}")
+
+    async def send_loop():
+        """Send commands as soon as recv_loop queues them, coalescing any backlog into one write."""
+        last_sent: Optional[bytes] = None
+        while True:
+            batch = [await cmd_queue.get()]
+            while not cmd_queue.empty():
+                batch.append(cmd_queue.get_nowait())
+
+            if SKIP_DUPLICATE_COMMANDS:
+                to_send = []
+                previous = last_sent
+                for cmd in batch:
+                    if cmd != previous or not _is_movement_only(cmd):
+                        to_send.append(cmd)
+                    previous = cmd
+                if not to_send:
+                    continue
+            else:
+                to_send = batch
+
+            # The command is calculated when receiving the image, see function ai_image_analyzer
+            try:
+                writer.write(b"".join(to_send))
+                await writer.drain()
+            except Exception as e:
+                print(f"[Port {port}] Send failed: {e}")
+                break
+            last_sent = to_send[-1]
+
+    # Run receiver and sender until either stops (game end, disconnect, send failure) or shutdown
+    tasks = [
+        asyncio.create_task(recv_loop()),
+        asyncio.create_task(send_loop()),
+        asyncio.create_task(_shutdown_event.wait()),
+    ]
+    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        # Report unexpected errors (e.g. a bug in ai_image_analyzer) instead of closing silently
+        if not task.cancelled() and task.exception() is not None:
+            exc = task.exception()
+            print(f"[Port {port}] Unexpected error:")
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
     print(f"[Port {port}] Connection closed.")
 
 
-def run_ai_server(port: int):
-    global server_sock
+async def run_ai_server(port: int):
+    global _loop, _shutdown_event
     HOST = "127.0.0.1"
     PORT = port
 
+    _loop = asyncio.get_running_loop()
+    _shutdown_event = asyncio.Event()
+    if shutdown:
+        _shutdown_event.set()
+
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Set before listening so accepted connections inherit it and the TCP window scale is negotiated for it
+    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 262144)
     server_sock.bind((HOST, PORT))
-    server_sock.listen(5)
-    server_sock.settimeout(1.0)
+
+    server = await asyncio.start_server(
+        functools.partial(handle_client, port=PORT), sock=server_sock, backlog=5
+    )
     print(f"AI server listening on {HOST}:{PORT} (Ctrl+C to stop)...")
 
-    while not shutdown:
-        try:
-            conn, addr = server_sock.accept()
-            handle_client(conn, addr, PORT)
-        except socket.timeout:
-            continue
-        except OSError:
-            break
+    if DEBUG_SAVE_EVERY_N:
+        threading.Thread(target=save_worker, daemon=True).start()
+
+    async with server:
+        await _shutdown_event.wait()
 
     print("AI server has shut down.")
 
@@ -367,4 +542,7 @@ if __name__ == "__main__":
     except ValueError:
         print("Port must be an integer.")
         sys.exit(1)
-    run_ai_server(port_num)
+    # Installed here rather than at import: loading _analyze from the Numba cache may import this file
+    # again as a module, which must not replace this handler with one bound to the other copy's globals
+    signal.signal(signal.SIGINT, signal_handler)
+    asyncio.run(run_ai_server(port_num))